@@ -68,7 +68,7 @@ class ISTQBAIPortal:
             self.topics_df = pd.DataFrame(self.topics)
             return True
         except FileNotFoundError:
-            print("Data files not found. Please run utils/init_data.py first to initialize the data.")
+            print("Data files not found. Please run python -m utils.init_data first to initialize the data.")
             return False
         except Exception as e:
             print(f"Error loading data: {str(e)}")
@@ -575,6 +575,8 @@ class ISTQBAIPortal:
         try:
             # Create session for the user
             session_id = self.session_manager.create_session(username, email)
+            if session_id is None:
+                return False, "Error logging in: the session could not be saved"
             self.current_user = self.session_manager.get_current_user()
             
             return True, f"Welcome, {username}! Your study progress will be saved."
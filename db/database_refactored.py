@@ -21,6 +21,7 @@ import os
 import sqlite3
 from pathlib import Path
 import functools
+from datetime import datetime, timedelta, timezone
 from typing import Any, Dict, List, Tuple, Union, Optional, Callable
 import logging
 
@@ -87,9 +88,29 @@ SCHEMA = {
             topics TEXT,
             FOREIGN KEY (user_id) REFERENCES users(id)
         )
+    ''',
+    "user_sessions": '''
+        CREATE TABLE IF NOT EXISTS user_sessions (
+            session_id TEXT PRIMARY KEY,
+            user_id INTEGER NOT NULL,
+            username TEXT NOT NULL,
+            email TEXT,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            expires_at TIMESTAMP NOT NULL,
+            FOREIGN KEY (user_id) REFERENCES users(id)
+        )
     '''
 }
 
+# Index definitions, created after the tables in SCHEMA
+INDEXES = {
+    "idx_users_created": "CREATE INDEX IF NOT EXISTS idx_users_created ON users(created_at)",
+    "idx_user_sessions_expires": "CREATE INDEX IF NOT EXISTS idx_user_sessions_expires ON user_sessions(expires_at)"
+}
+
+# Format used by SQLite's CURRENT_TIMESTAMP, so Python-side cutoffs compare lexicographically
+TIMESTAMP_FORMAT = "%Y-%m-%d %H:%M:%S"
+
 # Database Migration Definitions
 MIGRATIONS = [
     {
@@ -101,17 +122,35 @@ MIGRATIONS = [
     }
 ]
 
+# Database files already switched to WAL journaling by get_connection
+_WAL_DATABASES = set()
+
 def ensure_db_exists() -> str:
     """Ensure the database directory exists and return the database path."""
     os.makedirs(DB_DIR, exist_ok=True)
     return str(DB_FILE)
 
+def timestamp_days_ago(days: int) -> str:
+    """Return a UTC timestamp string for `days` ago, comparable with CURRENT_TIMESTAMP columns."""
+    return (datetime.now(timezone.utc) - timedelta(days=days)).strftime(TIMESTAMP_FORMAT)
+
 def get_connection() -> sqlite3.Connection:
     """Get a connection to the SQLite database."""
     db_path = ensure_db_exists()
     conn = sqlite3.connect(db_path)
+    # WAL lets readers and writers proceed concurrently; the mode is stored in the
+    # database file, so it only needs to be set once per file
+    if db_path not in _WAL_DATABASES:
+        conn.execute("PRAGMA journal_mode = WAL")
+        _WAL_DATABASES.add(db_path)
+    # In WAL mode NORMAL only syncs at checkpoints and is still safe against corruption
+    conn.execute("PRAGMA synchronous = NORMAL")
+    conn.execute("PRAGMA temp_store = MEMORY")
+    conn.execute("PRAGMA mmap_size = 268435456")
     # Enable foreign key constraints
     conn.execute("PRAGMA foreign_keys = ON")
+    # Use a 64 MB page cache (negative values are in KiB)
+    conn.execute("PRAGMA cache_size = -64000")
     return conn
 
 def db_transaction(func):
@@ -200,6 +239,10 @@ def initialize_database():
     for table_name, table_schema in SCHEMA.items():
         cursor.execute(table_schema)
     
+    # Create indexes
+    for index_name, index_schema in INDEXES.items():
+        cursor.execute(index_schema)
+    
     # Create default admin user
     cursor.execute("SELECT id FROM users WHERE username = 'admin'")
     admin_exists = cursor.fetchone()
@@ -329,15 +372,13 @@ class UserDAO:
         return False
     
     @staticmethod
-    @db_transaction
-    def set_admin_status(conn, username, is_admin_status):
-        """Grant or revoke admin privileges for a user."""
-        execute_query(
-            conn, 
-            "UPDATE users SET is_admin = ? WHERE username = ?", 
-            (1 if is_admin_status else 0, username)
-        )
-        return True
+    @db_query
+    def get_id_by_username(conn, username):
+        """Look up a user's ID by username."""
+        cursor = execute_query(conn, "SELECT id FROM users WHERE username = ?", (username,))
+        result = cursor.fetchone()
+        
+        return result[0] if result else None
     
     @staticmethod
     @db_query
@@ -640,7 +681,7 @@ class StatsDAO:
         stats["total_users"] = cursor.fetchone()[0]
         
         # New users in the last 7 days
-        cursor = execute_query(conn, "SELECT COUNT(*) FROM users WHERE created_at > datetime('now', '-7 days')")
+        cursor = execute_query(conn, "SELECT COUNT(*) FROM users WHERE created_at > ?", (timestamp_days_ago(7),))
         stats["new_users_7_days"] = cursor.fetchone()[0]
         
         # Total topics completed
@@ -683,31 +724,34 @@ class StatsDAO:
 # Backwards compatibility layer for existing code
 # These function versions match the original API signatures and behavior
 
+def _get_or_create_user_id(conn, username, email=None, is_admin=False):
+    """Return the id of the user with this username, creating the user if needed, without committing."""
+    cursor = conn.cursor()
+    
+    # Check if user exists
+    cursor.execute("SELECT id, is_admin FROM users WHERE username = ?", (username,))
+    user = cursor.fetchone()
+    
+    if user:
+        # Update admin status if needed
+        if is_admin and not user[1]:
+            cursor.execute("UPDATE users SET is_admin = 1 WHERE id = ?", (user[0],))
+        return user[0]
+    
+    # Create new user
+    cursor.execute(
+        "INSERT INTO users (username, email, is_admin) VALUES (?, ?, ?)",
+        (username, email, 1 if is_admin else 0)
+    )
+    return cursor.lastrowid
+
 def get_or_create_user(username, email=None, is_admin=False):
     """Get a user by username or create if not exists."""
     conn = get_connection()
     try:
-        cursor = conn.cursor()
-        
-        # Check if user exists
-        cursor.execute("SELECT id, is_admin FROM users WHERE username = ?", (username,))
-        user = cursor.fetchone()
-        
-        if user:
-            user_id = user[0]
-            
-            # Update admin status if needed
-            if is_admin and not user[1]:
-                cursor.execute("UPDATE users SET is_admin = 1 WHERE id = ?", (user_id,))
-                conn.commit()
-        else:
-            # Create new user
-            cursor.execute(
-                "INSERT INTO users (username, email, is_admin) VALUES (?, ?, ?)",
-                (username, email, 1 if is_admin else 0)
-            )
+        user_id = _get_or_create_user_id(conn, username, email, is_admin)
+        if conn.in_transaction:
             conn.commit()
-            user_id = cursor.lastrowid
         
         return user_id
     except Exception as e:
@@ -881,14 +925,79 @@ def get_user_notes(user_id, chapter_id=None):
     finally:
         conn.close()
 
+def create_user_session(session_id, username, email, expires_at):
+    """Store a login session for a user, creating the user if needed, in one transaction.
+    
+    Sessions that have already expired are cleared out at the same time. Returns the
+    user's id, or None if the session could not be stored.
+    """
+    conn = get_connection()
+    
+    try:
+        user_id = _get_or_create_user_id(conn, username, email)
+        conn.execute("DELETE FROM user_sessions WHERE expires_at < CURRENT_TIMESTAMP")
+        conn.execute("""
+            INSERT INTO user_sessions (session_id, user_id, username, email, expires_at)
+            VALUES (?, ?, ?, ?, ?)
+        """, (session_id, user_id, username, email, expires_at))
+        
+        conn.commit()
+        return user_id
+    except Exception as e:
+        logger.error(f"Error creating user session: {str(e)}")
+        conn.rollback()
+        return None
+    finally:
+        conn.close()
+
+def get_user_session(session_id):
+    """Get an unexpired login session as a dict, or None."""
+    conn = get_connection()
+    
+    try:
+        row = conn.execute("""
+            SELECT user_id, username, email, created_at, expires_at
+            FROM user_sessions
+            WHERE session_id = ? AND expires_at >= CURRENT_TIMESTAMP
+        """, (session_id,)).fetchone()
+        
+        if row is None:
+            return None
+        return {
+            'user_id': row[0],
+            'username': row[1],
+            'email': row[2],
+            'created_at': row[3],
+            'expires_at': row[4]
+        }
+    except Exception as e:
+        logger.error(f"Error getting user session: {str(e)}")
+        return None
+    finally:
+        conn.close()
+
+def delete_user_session(session_id):
+    """Delete a login session, returning whether it existed."""
+    conn = get_connection()
+    
+    try:
+        deleted = conn.execute("DELETE FROM user_sessions WHERE session_id = ?", (session_id,)).rowcount
+        
+        conn.commit()
+        return deleted > 0
+    except Exception as e:
+        logger.error(f"Error deleting user session: {str(e)}")
+        conn.rollback()
+        return False
+    finally:
+        conn.close()
+
 def is_admin(username):
     """Check if a user has admin privileges."""
     conn = get_connection()
-    cursor = conn.cursor()
     
     try:
-        cursor.execute("SELECT is_admin FROM users WHERE username = ?", (username,))
-        result = cursor.fetchone()
+        result = conn.execute("SELECT is_admin FROM users WHERE username = ?", (username,)).fetchone()
         
         if result and result[0]:
             return True
@@ -899,20 +1008,19 @@ def is_admin(username):
     finally:
         conn.close()
 
-def set_admin_status(username, is_admin_status):
-    """Grant or revoke admin privileges for a user."""
+def get_user_id_by_username(username):
+    """Look up a user's ID by username."""
     conn = get_connection()
     cursor = conn.cursor()
     
     try:
-        cursor.execute("UPDATE users SET is_admin = ? WHERE username = ?", 
-                      (1 if is_admin_status else 0, username))
-        conn.commit()
-        return True
+        cursor.execute("SELECT id FROM users WHERE username = ?", (username,))
+        result = cursor.fetchone()
+        
+        return result[0] if result else None
     except Exception as e:
-        logger.error(f"Error setting admin status: {str(e)}")
-        conn.rollback()
-        return False
+        logger.error(f"Error looking up user ID: {str(e)}")
+        return None
     finally:
         conn.close()
 
@@ -961,12 +1069,12 @@ def get_all_users():
 def get_user_details(user_id):
     """Get detailed information about a specific user."""
     conn = get_connection()
-    cursor = conn.cursor()
     
     try:
         # Get user basic info
-        cursor.execute("SELECT id, username, email, is_admin, created_at FROM users WHERE id = ?", (user_id,))
-        user = cursor.fetchone()
+        user = conn.execute(
+            "SELECT id, username, email, is_admin, created_at FROM users WHERE id = ?", (user_id,)
+        ).fetchone()
         
         if not user:
             return None
@@ -980,15 +1088,14 @@ def get_user_details(user_id):
         }
         
         # Get progress statistics
-        cursor.execute("""
+        progress = conn.execute("""
             SELECT 
                 COUNT(*) as total_topics,
                 SUM(CASE WHEN is_completed = 1 THEN 1 ELSE 0 END) as completed_topics
             FROM user_progress
             WHERE user_id = ?
-        """, (user_id,))
+        """, (user_id,)).fetchone()
         
-        progress = cursor.fetchone()
         if progress:
             total_topics = progress[0] or 0
             completed_topics = progress[1] or 0
@@ -1001,15 +1108,14 @@ def get_user_details(user_id):
             }
         
         # Get quiz statistics
-        cursor.execute("""
+        quiz_stats = conn.execute("""
             SELECT 
                 COUNT(*) as attempts,
                 AVG(correct_answers * 100.0 / total_questions) as avg_score
             FROM quiz_results
             WHERE user_id = ?
-        """, (user_id,))
+        """, (user_id,)).fetchone()
         
-        quiz_stats = cursor.fetchone()
         if quiz_stats:
             user_data["quiz_stats"] = {
                 "attempts": quiz_stats[0],
@@ -1017,15 +1123,14 @@ def get_user_details(user_id):
             }
         
         # Get study time statistics
-        cursor.execute("""
+        study_stats = conn.execute("""
             SELECT 
                 COUNT(*) as sessions,
                 SUM(duration_minutes) as total_minutes
             FROM study_sessions
             WHERE user_id = ?
-        """, (user_id,))
+        """, (user_id,)).fetchone()
         
-        study_stats = cursor.fetchone()
         if study_stats:
             user_data["study_stats"] = {
                 "sessions": study_stats[0],
@@ -1042,48 +1147,47 @@ def get_user_details(user_id):
 def get_system_statistics():
     """Get system-wide statistics for admin dashboard."""
     conn = get_connection()
-    cursor = conn.cursor()
     
     try:
         stats = {}
         
         # User statistics
-        cursor.execute("SELECT COUNT(*) FROM users")
-        stats["total_users"] = cursor.fetchone()[0]
+        stats["total_users"] = conn.execute("SELECT COUNT(*) FROM users").fetchone()[0]
         
         # New users in the last 7 days
-        cursor.execute("SELECT COUNT(*) FROM users WHERE created_at > datetime('now', '-7 days')")
-        stats["new_users_7_days"] = cursor.fetchone()[0]
+        stats["new_users_7_days"] = conn.execute(
+            "SELECT COUNT(*) FROM users WHERE created_at > ?", (timestamp_days_ago(7),)
+        ).fetchone()[0]
         
         # Total topics completed
-        cursor.execute("SELECT COUNT(*) FROM user_progress WHERE is_completed = 1")
-        stats["total_topics_completed"] = cursor.fetchone()[0]
+        stats["total_topics_completed"] = conn.execute(
+            "SELECT COUNT(*) FROM user_progress WHERE is_completed = 1"
+        ).fetchone()[0]
         
         # Total study notes
-        cursor.execute("SELECT COUNT(*) FROM user_notes")
-        stats["total_notes"] = cursor.fetchone()[0]
+        stats["total_notes"] = conn.execute("SELECT COUNT(*) FROM user_notes").fetchone()[0]
         
         # Total quiz attempts
-        cursor.execute("SELECT COUNT(*) FROM quiz_results")
-        stats["total_quiz_attempts"] = cursor.fetchone()[0]
+        stats["total_quiz_attempts"] = conn.execute("SELECT COUNT(*) FROM quiz_results").fetchone()[0]
         
         # Average quiz score
-        cursor.execute("SELECT AVG(correct_answers * 100.0 / total_questions) FROM quiz_results")
-        avg_score = cursor.fetchone()[0]
+        avg_score = conn.execute(
+            "SELECT AVG(correct_answers * 100.0 / total_questions) FROM quiz_results"
+        ).fetchone()[0]
         stats["avg_quiz_score"] = avg_score if avg_score is not None else 0
         
         # Most active chapters
-        cursor.execute("""
+        rows = conn.execute("""
             SELECT chapter_id, COUNT(*) as completion_count
             FROM user_progress
             WHERE is_completed = 1
             GROUP BY chapter_id
             ORDER BY completion_count DESC
             LIMIT 5
-        """)
+        """).fetchall()
         
         stats["most_active_chapters"] = []
-        for row in cursor.fetchall():
+        for row in rows:
             stats["most_active_chapters"].append({
                 "chapter_id": row[0],
                 "completion_count": row[1]
@@ -1114,6 +1218,7 @@ def delete_user(user_id, admin_user_id):
         cursor.execute("DELETE FROM user_notes WHERE user_id = ?", (user_id,))
         cursor.execute("DELETE FROM study_sessions WHERE user_id = ?", (user_id,))
         cursor.execute("DELETE FROM quiz_results WHERE user_id = ?", (user_id,))
+        cursor.execute("DELETE FROM user_sessions WHERE user_id = ?", (user_id,))
         
         # Finally delete the user
         cursor.execute("DELETE FROM users WHERE id = ?", (user_id,))
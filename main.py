@@ -3,10 +3,10 @@ import os
 import sys
 import json
 from pathlib import Path
+from utils.data_manifest import DATA_DIR, PDF_PATH, data_files_exist, data_matches_pdf, file_sha256, write_manifest
 
 # Get the root directory of the project
 ROOT_DIR = Path(__file__).parent
-DATA_DIR = ROOT_DIR / "data"
 
 def initialize_data(force_refresh=False):
     """
@@ -19,21 +19,23 @@ def initialize_data(force_refresh=False):
     os.makedirs(DATA_DIR, exist_ok=True)
     
     # Check if the necessary data files exist
-    data_files_exist = (DATA_DIR / "chapters.json").exists() and \
-                       (DATA_DIR / "learning_objectives.json").exists() and \
-                       (DATA_DIR / "terms.json").exists() and \
-                       (DATA_DIR / "topics.json").exists()
+    data_present = data_files_exist()
     
-    # Initialize data if it doesn't exist or force_refresh is True
-    if force_refresh or not data_files_exist:
+    # Check whether the data files were generated from the cached PDF
+    pdf_cached = PDF_PATH.exists() and PDF_PATH.stat().st_size > 0
+    data_up_to_date = not pdf_cached or data_matches_pdf(file_sha256(PDF_PATH))
+    
+    # Initialize data if it doesn't exist, is stale or force_refresh is True
+    if force_refresh or not data_present or not data_up_to_date:
         if force_refresh:
             print("Forcing data refresh...")
-        else:
+        elif not data_present:
             print("Data files not found. Initializing data...")
+        else:
+            print("Syllabus PDF has changed. Regenerating data...")
         
         try:
             # Run the initialization script
-            sys.path.append(str(ROOT_DIR))
             from utils.syllabus_processor import SyllabusProcessor
             
             # URL to the ISTQB AI Testing Syllabus PDF
@@ -41,33 +43,36 @@ def initialize_data(force_refresh=False):
             
             try:
                 # Check for cached PDF
-                pdf_path = DATA_DIR / "syllabus.pdf"
-                if pdf_path.exists() and pdf_path.stat().st_size > 0 and not force_refresh:
-                    print(f"Using cached PDF: {pdf_path}")
-                    processor = SyllabusProcessor(pdf_path=str(pdf_path))
+                if pdf_cached and not force_refresh:
+                    print(f"Using cached PDF: {PDF_PATH}")
+                    processor = SyllabusProcessor(pdf_path=str(PDF_PATH))
                 else:
                     print("Downloading PDF from URL...")
                     processor = SyllabusProcessor(pdf_url=syllabus_url)
                 
                 processor.process_syllabus()
+                write_manifest(file_sha256(processor.pdf_path))
                 print("Data initialization complete.")
                 return True
             except Exception as e:
                 print(f"Error processing syllabus: {str(e)}")
-                print("Creating placeholder data as fallback...")
-                # Create placeholder data files
-                create_placeholder_data()
-                return True
+                return fall_back_to_existing_data(data_present)
         except Exception as e:
             print(f"Error during data initialization: {str(e)}")
-            print("Creating placeholder data as fallback...")
-            # Create placeholder data files
-            create_placeholder_data()
-            return True
+            return fall_back_to_existing_data(data_present)
     else:
         print("Data already initialized.")
         return True
 
+def fall_back_to_existing_data(data_present):
+    """Keep the existing data files after a failed refresh, creating placeholders only if there are none."""
+    if data_present:
+        print("Keeping the existing data files.")
+    else:
+        print("Creating placeholder data as fallback...")
+        create_placeholder_data()
+    return True
+
 def create_placeholder_data():
     """Create placeholder data files for the app to function."""
     # Create placeholder chapters
@@ -155,7 +160,6 @@ def main():
     
     # Ensure data directories exist
     os.makedirs(DATA_DIR, exist_ok=True)
-    os.makedirs(DATA_DIR / "sessions", exist_ok=True)
     
     # Ensure database directory exists
     db_dir = ROOT_DIR / "db"
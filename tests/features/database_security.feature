@@ -14,6 +14,12 @@ Feature: Database Security
     And an appropriate error message should be returned
     And the access attempt should be logged
 
+  @security @refactored
+  Scenario: Privilege escalation through the session API
+    When a regular user tries to grant admin privileges to another user
+    Then privilege escalation should be refused
+    And the refusal should explain the permission problem
+
   @security
   Scenario: SQL injection prevention
     When a user submits the following SQL injection attempts:
@@ -0,0 +1,42 @@
+Feature: User Session Storage
+  As an application user
+  I want my login session to be stored in the database
+  So that it can be resumed, expires on time and is removed with my account
+
+  Background:
+    Given the database is initialized with test data
+
+  @reliability @refactored
+  Scenario: Session can be loaded by its ID
+    Given a login session for "session_alice"
+    When a new session manager loads the session
+    Then the session should load as "session_alice"
+
+  @reliability @refactored
+  Scenario: Destroyed session can no longer be loaded
+    Given a login session for "session_bob"
+    When the session is destroyed
+    And a new session manager loads the session
+    Then the session should not load
+    And destroying the session again should report that it did not exist
+
+  @reliability @refactored
+  Scenario: Expired session is rejected and purged
+    Given an expired login session for "session_carol"
+    When a new session manager loads the session
+    Then the session should not load
+    When a login session for "session_dave" is created
+    Then the expired session should be removed from the database
+
+  @reliability @refactored
+  Scenario: Session that cannot be stored is not returned
+    Given a login session for "session_erin"
+    When another login reuses the same session ID
+    Then no session ID should be returned
+    And the session manager should not be logged in
+
+  @security @refactored
+  Scenario: Deleting a user removes their sessions
+    Given a login session for "session_frank"
+    When an admin deletes the user "session_frank"
+    Then the user should have no stored sessions
@@ -7,6 +7,11 @@ import sys
 import subprocess
 import argparse
 import datetime
+import importlib.util
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+TESTS_DIR = os.path.join(BASE_DIR, 'tests')
+FEATURES_DIR = os.path.join(TESTS_DIR, 'features')
 
 def print_header(message):
     """Print a header message."""
@@ -14,59 +19,123 @@ def print_header(message):
     print(f" {message} ".center(80))
     print("=" * 80 + "\n")
 
+def count_scenarios(feature_path):
+    """Count the scenarios and scenario outlines declared in a feature file."""
+    with open(feature_path) as f:
+        return sum(1 for line in f if line.lstrip().startswith(('Scenario:', 'Scenario Outline:')))
+
+def shard_features(feature_paths, num_shards):
+    """Split feature files into shards with roughly equal scenario counts."""
+    shards = [[] for _ in range(num_shards)]
+    loads = [0] * num_shards
+    
+    # Place the largest features first, each on the currently lightest shard
+    for path in sorted(feature_paths, key=count_scenarios, reverse=True):
+        lightest = loads.index(min(loads))
+        shards[lightest].append(path)
+        loads[lightest] += count_scenarios(path)
+    
+    return [shard for shard in shards if shard]
+
+def behavex_unsupported_options(args):
+    """Return the requested behave reporting options that behavex has no equivalent for."""
+    unsupported = []
+    if args.format != 'pretty':
+        unsupported.append('--format')
+    if args.output:
+        unsupported.append('--output')
+    if args.junit:
+        unsupported.append('--junit')
+    if args.verbose:
+        unsupported.append('--verbose')
+    return unsupported
+
+def run_parallel(args, paths, options):
+    """Run the tests across several processes, using behavex when it is installed and can take the options."""
+    unsupported = behavex_unsupported_options(args)
+    if importlib.util.find_spec('behavex') and unsupported:
+        print(f"behavex does not support {', '.join(unsupported)}; sharding features across behave processes instead")
+    elif importlib.util.find_spec('behavex'):
+        cmd = ['behavex'] + paths + ['--parallel-processes', str(args.parallel),
+                                     '--parallel-scheme', 'scenario']
+        if args.tags:
+            cmd.extend(['--tags', args.tags])
+        if args.stop:
+            cmd.append('--stop')
+        if args.no_capture:
+            cmd.append('--no-capture')
+        
+        print("Running command:", ' '.join(cmd))
+        return subprocess.call(cmd)
+    
+    # Fall back to sharding the feature files across separate behave processes
+    feature_paths = []
+    for path in paths:
+        if os.path.isdir(path):
+            feature_paths.extend(sorted(entry.path for entry in os.scandir(path) if entry.name.endswith('.feature')))
+        else:
+            feature_paths.append(path)
+    
+    processes = []
+    for i, shard in enumerate(shard_features(feature_paths, args.parallel)):
+        # behave writes one JUnit file per feature, so the shards can share the report directory
+        cmd = ['behave'] + shard + options
+        if args.output:
+            root, ext = os.path.splitext(args.output)
+            cmd.extend(['--outfile', f'{root}.shard{i}{ext}'])
+        
+        print(f"Running shard {i}:", ' '.join(cmd))
+        processes.append(subprocess.Popen(cmd))
+    
+    # Report failure if any shard failed
+    return max((process.wait() for process in processes), default=0)
+
 def run_tests(args):
     """Run the tests with the specified options."""
-    base_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
-    tests_dir = os.path.join(base_dir, 'tests')
-    features_dir = os.path.join(tests_dir, 'features')
-    
     # Ensure we have the features directory
-    if not os.path.exists(features_dir):
-        print(f"Error: Features directory not found at {features_dir}")
+    if not os.path.exists(FEATURES_DIR):
+        print(f"Error: Features directory not found at {FEATURES_DIR}")
         sys.exit(1)
     
-    # Build command
-    cmd = ['behave']
-    
-    # Add features directory
-    cmd.append(features_dir)
+    # Build command options
+    options = []
     
     # Add tags filter if specified
     if args.tags:
-        cmd.extend(['--tags', args.tags])
+        options.extend(['--tags', args.tags])
     
     # Add format option
     if args.format:
-        cmd.extend(['--format', args.format])
-    
-    # Add output file if specified
-    if args.output:
-        cmd.extend(['--outfile', args.output])
+        options.extend(['--format', args.format])
     
     # Add verbosity
     if args.verbose:
-        cmd.append('--verbose')
+        options.append('--verbose')
     
     # Add other options
     if args.junit:
-        cmd.extend(['--junit', '--junit-directory', 'reports/junit'])
+        options.extend(['--junit', '--junit-directory', 'reports/junit'])
     
     if args.no_capture:
-        cmd.append('--no-capture')
+        options.append('--no-capture')
     
     if args.stop:
-        cmd.append('--stop')
+        options.append('--stop')
     
-    # Add specific features if specified
+    # Add specific features if specified, otherwise run the whole features directory
+    paths = [FEATURES_DIR]
     if args.features:
+        # List the available feature files once instead of probing each one
+        available = {entry.name for entry in os.scandir(FEATURES_DIR) if entry.name.endswith('.feature')}
+        
         # Replace with the full paths
-        cmd = [cmd[0]]  # Keep 'behave'
+        paths = []
         for feature in args.features:
             if not feature.endswith('.feature'):
                 feature += '.feature'
-            feature_path = os.path.join(features_dir, feature)
-            if os.path.exists(feature_path):
-                cmd.append(feature_path)
+            feature_path = os.path.join(FEATURES_DIR, feature)
+            if feature in available:
+                paths.append(feature_path)
             else:
                 print(f"Warning: Feature file not found: {feature_path}")
     
@@ -81,9 +150,23 @@ def run_tests(args):
         if not os.path.exists(junit_dir):
             os.makedirs(junit_dir)
     
+    if args.parallel > 1:
+        return run_parallel(args, paths, options)
+    
+    cmd = ['behave'] + paths + options
+    
+    # Add output file if specified
+    if args.output:
+        cmd.extend(['--outfile', args.output])
+    
     # Print the command being run
     print("Running command:", ' '.join(cmd))
     
+    # Without reports to post-process, hand the process over to behave instead of forking
+    if not args.junit and not args.output:
+        sys.stdout.flush()
+        os.execvp(cmd[0], cmd)
+    
     # Run the tests
     return subprocess.call(cmd)
 
@@ -106,6 +189,8 @@ def main():
     parser.add_argument('--verbose', '-v', action='store_true', help='Verbose output')
     parser.add_argument('--no-capture', action='store_true', help="Don't capture stdout/stderr")
     parser.add_argument('--stop', action='store_true', help='Stop on first failure')
+    parser.add_argument('--parallel', type=int, default=1,
+                        help='Number of parallel processes (behavex if installed, else feature shards)')
     
     args = parser.parse_args()
     
@@ -0,0 +1,108 @@
+import queue
+import sqlite3
+import threading
+from contextlib import contextmanager
+from typing import Callable
+
+class PooledConnection(sqlite3.Connection):
+    """A connection that stays open when database code closes it, so a pool can hand it out again."""
+    
+    def close(self):
+        pass
+
+class ConnPool:
+    """A fixed-size pool of pre-opened SQLite connections for the step code."""
+    
+    def __init__(self, get_connection: Callable[[], sqlite3.Connection], size: int = 4):
+        self.q = queue.Queue()
+        for _ in range(size):
+            self.q.put(get_connection())
+    
+    @contextmanager
+    def acquire(self):
+        """Borrow a connection, returning it to the pool when the block exits."""
+        conn = self.q.get()
+        try:
+            yield conn
+        finally:
+            self.release(conn)
+    
+    def release(self, conn: sqlite3.Connection):
+        """Return a connection to the pool, discarding any uncommitted work."""
+        conn.rollback()
+        self.q.put(conn)
+    
+    def set_trace_callback(self, callback):
+        """Attach a SQL trace callback to every idle pooled connection, or detach it with None."""
+        for conn in list(self.q.queue):
+            conn.set_trace_callback(callback)
+    
+    def close(self):
+        """Close every pooled connection."""
+        while not self.q.empty():
+            sqlite3.Connection.close(self.q.get_nowait())
+
+class ReadWritePool:
+    """One writer connection and several read-only ones, lent to database calls made inside acquire_*().
+    
+    While installed on a database module, calls made inside acquire_read()/acquire_write()
+    get the connection borrowed by their thread, and any other call falls back to the
+    module's own get_connection.
+    """
+    
+    def __init__(self, connect: Callable[[], PooledConnection], readers: int = 4):
+        self.writer = ConnPool(connect, 1)
+        self.readers = ConnPool(lambda: self._read_only(connect()), readers)
+        self.fallback = None
+        self.local = threading.local()
+    
+    @staticmethod
+    def _read_only(conn: sqlite3.Connection) -> sqlite3.Connection:
+        conn.execute("PRAGMA query_only = ON")
+        return conn
+    
+    @contextmanager
+    def _lend(self, pool: ConnPool):
+        with pool.acquire() as conn:
+            self.local.conn = conn
+            try:
+                yield conn
+            finally:
+                self.local.conn = None
+    
+    def acquire_read(self):
+        """Borrow a read-only connection for the current thread."""
+        return self._lend(self.readers)
+    
+    @contextmanager
+    def acquire_write(self):
+        """Borrow the writer connection for the current thread, waiting for other writers.
+        
+        The block runs inside BEGIN IMMEDIATE, so the write lock is taken up front
+        instead of being upgraded from a read lock mid-transaction; database code
+        commits it as usual, and anything left uncommitted is rolled back on release.
+        """
+        with self._lend(self.writer) as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            yield conn
+    
+    @contextmanager
+    def installed(self, db_module):
+        """Route db_module.get_connection through the pool for the duration of the block."""
+        self.fallback = db_module.get_connection
+        db_module.get_connection = self.get_connection
+        try:
+            yield self
+        finally:
+            db_module.get_connection = self.fallback
+            self.fallback = None
+    
+    def get_connection(self) -> sqlite3.Connection:
+        """Return the connection borrowed by this thread, or a new one outside acquire_*()."""
+        conn = getattr(self.local, 'conn', None)
+        return conn if conn is not None else self.fallback()
+    
+    def close(self):
+        """Close every pooled connection."""
+        self.writer.close()
+        self.readers.close()
@@ -1,8 +1,16 @@
 import time
-import random
+import itertools
 import sqlite3
 from behave import given, when, then
 
+from utils.user import UserSession
+
+# Words an access-denied error message is expected to contain one of
+_PERMISSION_KEYWORDS = ("permission", "admin", "access", "denied")
+
+# Suffixes for the usernames steps create, unique for the whole run
+_uid = itertools.count(1)
+
 @when('a regular user attempts to access admin functionality')
 def step_impl(context):
     """Simulate a regular user attempting to access admin functionality."""
@@ -14,11 +22,9 @@ def step_impl(context):
     regular_user_id = context.regular_user_ids[0]
     
     # Get the username for this user
-    conn = context.db_module.get_connection()
-    cursor = conn.cursor()
+    cursor = context.conn.cursor()
     cursor.execute("SELECT username FROM users WHERE id = ?", (regular_user_id,))
     username = cursor.fetchone()[0]
-    conn.close()
     
     # Try to use admin functionality
     try:
@@ -33,13 +39,6 @@ def step_impl(context):
         if hasattr(context.db_module, 'get_all_users'):
             users = context.db_module.get_all_users()
             context.admin_access_succeeded = True
-        
-        # Try to set another user as admin
-        elif hasattr(context.db_module, 'set_admin_status'):
-            target_username = "someotheruser"
-            result = context.db_module.set_admin_status(target_username, True)
-            context.admin_access_succeeded = result
-            
         else:
             # Fallback if specific admin functions aren't available
             context.admin_access_succeeded = False
@@ -67,10 +66,8 @@ def step_impl(context):
     """Verify an appropriate error message was returned."""
     # If the operation threw an exception, we should have an error message
     if not context.admin_access_succeeded and hasattr(context, 'access_error'):
-        assert "permission" in context.access_error.lower() or \
-               "admin" in context.access_error.lower() or \
-               "access" in context.access_error.lower() or \
-               "denied" in context.access_error.lower(), \
+        error = context.access_error.lower()
+        assert any(keyword in error for keyword in _PERMISSION_KEYWORDS), \
                f"Error message does not indicate permission issue: {context.access_error}"
     
     # If the operation didn't throw an exception but still failed, that's also acceptable
@@ -81,7 +78,36 @@ def step_impl(context):
     """Verify the access attempt was logged."""
     # This would require a logging implementation in the database code
     # Since we can't verify actual logging, we'll just note this requirement
-    print("NOTE: Access attempt logging should be implemented in the database module")
+    if context.config.verbose:
+        print("NOTE: Access attempt logging should be implemented in the database module")
+
+@when('a regular user tries to grant admin privileges to another user')
+def step_impl(context):
+    """Call UserSession.make_admin while logged in as a regular user."""
+    regular_user_id, target_user_id = context.regular_user_ids[0], context.regular_user_ids[-1]
+    cursor = context.conn.cursor()
+    cursor.execute("SELECT username FROM users WHERE id = ?", (regular_user_id,))
+    username = cursor.fetchone()[0]
+    cursor.execute("SELECT username FROM users WHERE id = ?", (target_user_id,))
+    context.escalation_target = cursor.fetchone()[0]
+    
+    session = UserSession()
+    session.current_user = {'id': regular_user_id, 'username': username, 'email': None}
+    context.escalation_granted, context.escalation_message = session.make_admin(context.escalation_target)
+
+@then('privilege escalation should be refused')
+def step_impl(context):
+    """Verify the grant was refused and the target is still a regular user."""
+    assert not context.escalation_granted, "Regular user was allowed to grant admin privileges"
+    assert not context.db_module.is_admin(context.escalation_target), \
+           f"{context.escalation_target} was promoted to admin"
+
+@then('the refusal should explain the permission problem')
+def step_impl(context):
+    """Verify the refusal message names the missing privilege."""
+    message = context.escalation_message.lower()
+    assert any(keyword in message for keyword in _PERMISSION_KEYWORDS), \
+           f"Error message does not indicate permission issue: {context.escalation_message}"
 
 @when('a user submits the following SQL injection attempts')
 def step_impl(context):
@@ -94,61 +120,55 @@ def step_impl(context):
     context.injection_succeeded = False
     
     # Get the count of users before any attempts
-    conn = context.db_module.get_connection()
-    cursor = conn.cursor()
+    cursor = context.conn.cursor()
     cursor.execute("SELECT COUNT(*) FROM users")
     initial_user_count = cursor.fetchone()[0]
-    conn.close()
     
-    # Try each injection attempt
-    for attempt in injection_attempts:
-        print(f"Testing SQL injection attempt: {attempt}")
-        
-        try:
-            # Attempt direct SQL injection via username parameter
-            # This should fail safely if the code is properly parameterizing queries
-            result = context.db_module.get_or_create_user(attempt, "injection@test.com")
-            
-            # Try to check if this user is an admin (another injection vector)
-            is_admin = context.db_module.is_admin(attempt)
+    # Try each injection attempt. The attempts all run on the pool's writer connection,
+    # so the database functions' statements are compiled once and then served from
+    # its statement cache instead of being prepared again on a new connection per call
+    with context.rw_pool.installed(context.db_module), context.rw_pool.acquire_write():
+        for attempt in injection_attempts:
+            print(f"Testing SQL injection attempt: {attempt}")
             
-            # Record the result
-            context.injection_results.append({
-                'attempt': attempt,
-                'user_created': result is not None,
-                'is_admin': is_admin,
-                'error': None
-            })
-            
-            # If the injection made them an admin, that's a security issue
-            if is_admin:
-                context.injection_succeeded = True
+            try:
+                # Attempt direct SQL injection via username parameter
+                # This should fail safely if the code is properly parameterizing queries
+                result = context.db_module.get_or_create_user(attempt, "injection@test.com")
                 
-        except Exception as e:
-            # Record the error
-            context.injection_results.append({
-                'attempt': attempt,
-                'user_created': False,
-                'is_admin': False,
-                'error': str(e)
-            })
+                # Try to check if this user is an admin (another injection vector)
+                is_admin = context.db_module.is_admin(attempt)
+                
+                # Record the result
+                context.injection_results.append({
+                    'attempt': attempt,
+                    'user_created': result is not None,
+                    'is_admin': is_admin,
+                    'error': None
+                })
+                
+                # If the injection made them an admin, that's a security issue
+                if is_admin:
+                    context.injection_succeeded = True
+                    
+            except Exception as e:
+                # Record the error
+                context.injection_results.append({
+                    'attempt': attempt,
+                    'user_created': False,
+                    'is_admin': False,
+                    'error': str(e)
+                })
     
     # Check if any tables were dropped or modified
     try:
-        conn = context.db_module.get_connection()
-        cursor = conn.cursor()
-        
-        # Verify users table still exists
-        cursor.execute("SELECT COUNT(*) FROM users")
-        final_user_count = cursor.fetchone()[0]
-        
-        # See if table structure was damaged
-        cursor.execute("PRAGMA table_info(users)")
-        table_intact = len(cursor.fetchall()) > 0
+        cursor = context.conn.cursor()
         
-        conn.close()
+        # Verify users table still exists and see if its structure was damaged, in one query
+        cursor.execute("SELECT (SELECT COUNT(*) FROM users), (SELECT COUNT(*) FROM pragma_table_info('users'))")
+        final_user_count, column_count = cursor.fetchone()
         
-        context.tables_intact = table_intact
+        context.tables_intact = column_count > 0
         context.data_intact = final_user_count >= initial_user_count
         
     except Exception as e:
@@ -226,8 +246,7 @@ def step_impl(context):
             context.query_results.append(('get_user_details_error', str(e)))
     
     # Method 3: Direct database query
-    conn = context.db_module.get_connection()
-    cursor = conn.cursor()
+    cursor = context.conn.cursor()
     
     try:
         cursor.execute("SELECT * FROM users")
@@ -236,8 +255,6 @@ def step_impl(context):
     except Exception as e:
         context.query_results.append(('direct_query_error', str(e)))
     
-    conn.close()
-    
     print(f"Executed {len(context.query_results)} queries for user information")
 
 @then('email addresses should be properly protected')
@@ -250,8 +267,9 @@ def step_impl(context):
     # Note: This is a bit simplified since our test database doesn't implement 
     # actual encryption of sensitive data
     
-    print("NOTE: For production systems, email addresses should be encrypted at rest")
-    print("      and transmitted only over secure channels")
+    if context.config.verbose:
+        print("NOTE: For production systems, email addresses should be encrypted at rest")
+        print("      and transmitted only over secure channels")
 
 @then('raw password data should never be stored')
 def step_impl(context):
@@ -259,18 +277,12 @@ def step_impl(context):
     # Our schema doesn't have password fields at all, which is good from a
     # security perspective for this limited use case
     
-    conn = context.db_module.get_connection()
-    cursor = conn.cursor()
-    
     # Check users table schema for any password-like fields
-    cursor.execute("PRAGMA table_info(users)")
-    columns = cursor.fetchall()
+    columns = context.users_schema
     column_names = [col[1].lower() for col in columns]
     
     password_columns = [col for col in column_names if 'pass' in col or 'pwd' in col or 'secret' in col]
     
-    conn.close()
-    
     assert len(password_columns) == 0, \
         f"Schema contains potential password columns: {password_columns}"
     
@@ -282,28 +294,27 @@ def step_impl(context):
     # This is more about the application layer and transport security
     # For our testing purposes, we'll just make a note about it
     
-    print("NOTE: For production systems, ensure database connections use encryption")
-    print("      and all API endpoints handling user data use HTTPS")
+    if context.config.verbose:
+        print("NOTE: For production systems, ensure database connections use encryption")
+        print("      and all API endpoints handling user data use HTTPS")
 
 @given('I am logged in as a regular user')
 def step_impl(context):
     """Set up a regular user context."""
     # Create a regular user if needed
     if not hasattr(context, 'regular_user_ids') or not context.regular_user_ids:
-        username = f"regular_user_{random.randint(1000, 9999)}"
+        username = f"regular_user_{next(_uid)}"
         user_id = context.db_module.get_or_create_user(username, "regular@test.com", False)
         context.regular_user_ids = [user_id]
         context.current_username = username
     else:
         # Get username for the first regular user
-        conn = context.db_module.get_connection()
-        cursor = conn.cursor()
+        cursor = context.conn.cursor()
         cursor.execute("SELECT username FROM users WHERE id = ?", (context.regular_user_ids[0],))
         context.current_username = cursor.fetchone()[0]
-        conn.close()
     
     # Create another user to try to access
-    other_username = f"other_user_{random.randint(1000, 9999)}"
+    other_username = f"other_user_{next(_uid)}"
     other_user_id = context.db_module.get_or_create_user(other_username, "other@test.com")
     
     # Add some data for this other user
@@ -326,21 +337,18 @@ def step_impl(context):
         
         # Direct database query attempt (this shouldn't be possible in real app,
         # but we're testing the database layer)
-        conn = context.db_module.get_connection()
-        cursor = conn.cursor()
+        cursor = context.conn.cursor()
         
-        # Try to impersonate the other user by directly referencing their ID
+        # Try to impersonate the other user by directly referencing their ID; reaching
+        # a single row is enough to show the access went through
         cursor.execute(
-            "SELECT * FROM user_notes WHERE user_id = ?", 
+            "SELECT EXISTS(SELECT 1 FROM user_notes WHERE user_id = ?)", 
             (context.other_user_id,)
         )
-        other_user_notes = cursor.fetchall()
-        conn.close()
         
         # If we got results, the database isn't enforcing access controls at the DB level
         # (which is actually normal, as this is typically handled at the application layer)
-        context.unauthorized_access_succeeded = len(other_user_notes) > 0
-        context.unauthorized_data = other_user_notes
+        context.unauthorized_access_succeeded = bool(cursor.fetchone()[0])
         
     except Exception as e:
         context.unauthorized_access_succeeded = False
@@ -350,7 +358,7 @@ def step_impl(context):
     
     if context.unauthorized_access_succeeded:
         print("WARNING: Database allowed direct access to another user's data")
-        print(f"Retrieved {len(context.unauthorized_data)} records belonging to another user")
+        print("Retrieved records belonging to another user")
     else:
         print("Database layer prevented direct unauthorized access")
         if hasattr(context, 'access_error'):
@@ -361,5 +369,6 @@ def step_impl(context):
     """Verify the access attempt was logged."""
     # This would require a logging implementation in the database code
     # Since we can't verify actual logging, we'll just note this requirement
-    print("NOTE: Access attempt logging should be implemented in the database module")
-    print("      Unauthorized access attempts should trigger alerts in production systems")
+    if context.config.verbose:
+        print("NOTE: Access attempt logging should be implemented in the database module")
+        print("      Unauthorized access attempts should trigger alerts in production systems")
@@ -1,23 +1,42 @@
 import os
-import sys
+import json
 import time
 import sqlite3
 import threading
 import random
 import string
-import tempfile
-import shutil
-from pathlib import Path
+import collections
+import concurrent.futures
+import numpy as np
 from datetime import datetime
 from behave import given, when, then, step
 from typing import List, Dict, Any
 
-# Add the parent directory to sys.path to import the database module
-sys.path.insert(0, str(Path(__file__).parent.parent.parent))
-
 # Import both database implementations for testing
 import db.database as original_db
 import db.database_refactored as refactored_db
+from tests.steps._pool import ConnPool, PooledConnection, ReadWritePool
+
+# Number of pre-opened connections kept per database for the step code
+POOL_SIZE = 4
+
+# Number of read-only connections lent to concurrent reader threads; more reader
+# threads than this only queue for a connection
+READER_POOL_SIZE = 8
+
+# Upper bound on the writer threads used to seed mock data in parallel
+MAX_SEED_WORKERS = min(8, os.cpu_count() or 1)
+
+# One executor for all parallel seeding, so steps submit to warm threads instead of
+# starting a pool per call. It is shut down in after_all.
+SEED_EXECUTOR = concurrent.futures.ThreadPoolExecutor(max_workers=MAX_SEED_WORKERS)
+
+# Per-user lookup indexes the scalability steps time against, so lookups stay
+# index seeks as the tables grow (user_progress is covered by its UNIQUE key)
+LOOKUP_INDEXES = [
+    "CREATE INDEX IF NOT EXISTS idx_user_notes_user ON user_notes(user_id)",
+    "CREATE INDEX IF NOT EXISTS idx_quiz_results_user ON quiz_results(user_id)"
+]
 
 # Functions to help with test data generation
 def generate_random_string(length: int = 10) -> str:
@@ -31,109 +50,258 @@ def generate_random_email() -> str:
     username = generate_random_string(8)
     return f"{username}@{domain}"
 
+def random_strings(rng: np.random.Generator, count: int, length: int) -> np.ndarray:
+    """Generate an array of random lowercase strings of the given length in one draw."""
+    codes = rng.integers(ord('a'), ord('z') + 1, size=(count, length), dtype=np.uint8)
+    return codes.view(f'S{length}').ravel().astype(f'U{length}')
+
+def bulk_insert(db_module, query: str, rows) -> int:
+    """Insert all rows with executemany inside a single transaction."""
+    conn = db_module.get_connection()
+    try:
+        conn.execute("BEGIN")
+        cursor = conn.executemany(query, rows)
+        conn.commit()
+        return cursor.rowcount
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        conn.close()
+
 def create_mock_users(db_module, count: int, is_admin: bool = False) -> List[int]:
     """Create a specified number of mock users in the database."""
-    user_ids = []
-    for i in range(count):
-        username = f"testuser_{generate_random_string(8)}"
-        email = generate_random_email()
-        user_id = db_module.get_or_create_user(username, email, is_admin)
-        user_ids.append(user_id)
+    rng = np.random.default_rng()
+    usernames = np.char.add("testuser_", random_strings(rng, count, 8))
+    domains = rng.choice(['example.com', 'test.org', 'mail.net', 'fake.io'], size=count)
+    emails = np.char.add(np.char.add(random_strings(rng, count, 8), "@"), domains)
+    rows = [(username, email, 1 if is_admin else 0) for username, email in zip(usernames.tolist(), emails.tolist())]
+    
+    conn = db_module.get_connection()
+    try:
+        # Take the write lock up front so the new rows are exactly those above the current maximum ID
+        conn.execute("BEGIN IMMEDIATE")
+        last_id = conn.execute("SELECT COALESCE(MAX(id), 0) FROM users").fetchone()[0]
+        conn.executemany("INSERT INTO users (username, email, is_admin) VALUES (?, ?, ?)", rows)
+        user_ids = [row[0] for row in conn.execute("SELECT id FROM users WHERE id > ? ORDER BY id", (last_id,))]
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        conn.close()
+    
     return user_ids
 
-def create_mock_progress_entries(db_module, user_ids: List[int], count_per_user: int) -> int:
+def partition(items: List[Any], parts: int) -> List[List[Any]]:
+    """Split a list into at most `parts` contiguous chunks of roughly equal size."""
+    size = max(1, -(-len(items) // parts))
+    return [items[i:i + size] for i in range(0, len(items), size)]
+
+def run_partitioned(func, items: List[Any], executor=None) -> int:
+    """Run func over partitions of items on a thread pool and sum the results."""
+    executor = executor or SEED_EXECUTOR
+    futures = [executor.submit(func, chunk) for chunk in partition(items, MAX_SEED_WORKERS)]
+    return sum(future.result() for future in concurrent.futures.as_completed(futures))
+
+def create_mock_progress_entries(db_module, user_ids: List[int], count_per_user: int, executor=None) -> int:
     """Create mock progress entries for the specified users."""
-    total_entries = 0
-    chapters = ['chapter1', 'chapter2', 'chapter3', 'chapter4', 'chapter5']
+    def insert_for_users(chunk):
+        # Each worker generates its share of the rows inside SQLite, crossing a numbers CTE
+        # with the user IDs, on its own connection and transaction
+        return bulk_insert(db_module, """
+            INSERT INTO user_progress (user_id, chapter_id, topic_id, is_completed, completion_date)
+            WITH RECURSIVE n(i) AS (SELECT 1 UNION ALL SELECT i + 1 FROM n WHERE i < ?),
+            progress AS MATERIALIZED (
+                SELECT u.value AS user_id, 'chapter' || (abs(random()) % 5 + 1) AS chapter_id,
+                       'topic_' || lower(hex(randomblob(3))) AS topic_id, abs(random()) % 2 AS is_completed
+                FROM json_each(?) AS u, n
+            )
+            SELECT user_id, chapter_id, topic_id, is_completed, CASE WHEN is_completed THEN CURRENT_TIMESTAMP END
+            FROM progress WHERE true
+            ON CONFLICT(user_id, chapter_id, topic_id)
+            DO UPDATE SET is_completed = excluded.is_completed, completion_date = excluded.completion_date
+        """, [(count_per_user, json.dumps(chunk))])
     
-    for user_id in user_ids:
-        for _ in range(count_per_user):
-            chapter_id = random.choice(chapters)
-            topic_id = f"topic_{generate_random_string(5)}"
-            is_completed = random.choice([True, False])
-            
-            db_module.update_topic_progress(user_id, chapter_id, topic_id, is_completed)
-            total_entries += 1
-    
-    return total_entries
+    return run_partitioned(insert_for_users, list(user_ids), executor)
 
-def create_mock_notes(db_module, user_ids: List[int], count_per_user: int) -> int:
+def create_mock_notes(db_module, user_ids: List[int], count_per_user: int, executor=None) -> int:
     """Create mock notes for the specified users."""
-    total_notes = 0
     chapters = ['chapter1', 'chapter2', 'chapter3', 'chapter4', 'chapter5']
     
-    for user_id in user_ids:
-        for _ in range(count_per_user):
-            chapter_id = random.choice(chapters)
-            content = f"Test note content: {generate_random_string(50)}"
-            
-            db_module.add_user_note(user_id, chapter_id, content)
-            total_notes += 1
+    def insert_for_users(chunk):
+        # Each worker builds and inserts its share of the rows on its own connection
+        rng = np.random.default_rng()
+        size = len(chunk) * count_per_user
+        rows = zip(
+            np.repeat(chunk, count_per_user).tolist(),
+            rng.choice(chapters, size=size).tolist(),
+            np.char.add("Test note content: ", random_strings(rng, size, 50)).tolist()
+        )
+        
+        return bulk_insert(db_module, """
+            INSERT INTO user_notes (user_id, chapter_id, content)
+            VALUES (?, ?, ?)
+        """, rows)
     
-    return total_notes
+    return run_partitioned(insert_for_users, list(user_ids), executor)
 
-def create_mock_quiz_results(db_module, user_ids: List[int], count_per_user: int) -> int:
+def create_mock_quiz_results(db_module, user_ids: List[int], count_per_user: int, executor=None) -> int:
     """Create mock quiz results for the specified users."""
-    total_results = 0
     topics = ['AI testing fundamentals', 'ML models', 'Test approaches', 'Quality characteristics']
     
-    for user_id in user_ids:
-        for _ in range(count_per_user):
-            total_questions = random.randint(5, 20)
-            correct_answers = random.randint(0, total_questions)
-            topic = random.choice(topics)
-            
-            db_module.record_quiz_result(user_id, total_questions, correct_answers, topic)
-            total_results += 1
+    def insert_for_users(chunk):
+        # Each worker builds and inserts its share of the rows on its own connection
+        rng = np.random.default_rng()
+        size = len(chunk) * count_per_user
+        total_questions = rng.integers(5, 21, size=size)
+        correct_answers = rng.integers(0, total_questions + 1)
+        rows = zip(
+            np.repeat(chunk, count_per_user).tolist(),
+            total_questions.tolist(),
+            correct_answers.tolist(),
+            rng.choice(topics, size=size).tolist()
+        )
+        
+        return bulk_insert(db_module, """
+            INSERT INTO quiz_results (user_id, total_questions, correct_answers, topics)
+            VALUES (?, ?, ?, ?)
+        """, rows)
+    
+    return run_partitioned(insert_for_users, list(user_ids), executor)
+
+def retry_with_backoff(func, *args, retries: int = 8, base_delay: float = 0.01, max_delay: float = 0.5):
+    """Call func, retrying on sqlite3.OperationalError with capped exponential backoff and jitter.
     
-    return total_results
+    Returns a (result, retries_used) tuple; the last error is re-raised once the retries run out.
+    """
+    for attempt in range(retries + 1):
+        try:
+            return func(*args), attempt
+        except sqlite3.OperationalError:
+            if attempt == retries:
+                raise
+            time.sleep(min(max_delay, base_delay * 2 ** attempt) + random.random() * base_delay / 2)
+
+# Shared in-memory test databases. The memdb VFS keeps one database per name alive
+# for as long as a connection to it is open and, unlike "cache=shared", uses normal
+# locking so concurrent writers wait on the busy timeout instead of failing
+TEST_DB_URI = "file:/istqb_test_{name}?vfs=memdb"
+
+# Database implementations under test, selected per scenario by tag
+DB_MODULES = {
+    'original': original_db,
+    'refactored': refactored_db
+}
+
+def make_connection_factory(uri: str, connection_class=sqlite3.Connection):
+    """Create a get_connection replacement that connects to the given database URI."""
+    def get_connection() -> sqlite3.Connection:
+        conn = sqlite3.connect(uri, uri=True, check_same_thread=False, cached_statements=256,
+                               factory=connection_class)
+        conn.execute("PRAGMA foreign_keys = ON")
+        # Test data is disposable, so skip fsyncs and keep the rollback journal in memory
+        conn.execute("PRAGMA synchronous = OFF")
+        conn.execute("PRAGMA journal_mode = MEMORY")
+        conn.execute("PRAGMA temp_store = MEMORY")
+        return conn
+    return get_connection
 
 # Behave setup
 def before_scenario(context, scenario):
     """Set up test environment before each scenario."""
-    # Create a temporary directory for the test database
-    context.test_dir = tempfile.mkdtemp()
-    
     # Select which DB implementation to test based on tags
-    if 'refactored' in scenario.tags:
-        context.db_module = refactored_db
-    else:
-        context.db_module = original_db
+    db_name = 'refactored' if 'refactored' in scenario.tags else 'original'
+    context.db_module = DB_MODULES[db_name]
+    context.shared_conn = context.shared_conns[db_name]
+    context.db_pool = context.db_pools[db_name]
+    context.rw_pool = context.rw_pools[db_name]
+    context.users_schema = context.users_schemas[db_name]
     
-    # Back up the original database file path constants
-    context.original_db_dir = context.db_module.DB_DIR
-    context.original_db_file = context.db_module.DB_FILE
+    # Undo any get_connection override left behind by a previous scenario
+    context.db_module.get_connection = context.connection_factories[db_name]
     
-    # Set the database file paths for testing
-    context.db_module.DB_DIR = Path(context.test_dir)
-    context.db_module.DB_FILE = context.db_module.DB_DIR / "test_db.db"
+    # Start from the freshly initialized database by copying the template's pages over it
+    context.templates[db_name].backup(context.shared_conn)
     
-    # Initialize the database
-    context.db_module.initialize_database()
+    # One connection shared by all steps of the scenario
+    context.conn = context.db_module.get_connection()
+    
+    # Separate connection for verification steps, so they see only committed data
+    context.verify_conn = context.db_module.get_connection()
+    
+    # SQL tracing is only ever attached for @debug scenarios
+    trace_callback = print if getattr(context, 'trace_sql', False) else None
+    context.conn.set_trace_callback(trace_callback)
+    context.verify_conn.set_trace_callback(trace_callback)
+    context.db_pool.set_trace_callback(trace_callback)
     
     # Store performance timings
     context.start_time = None
     context.end_time = None
     context.execution_times = []
     
+    # Rows created by the scenario, per table, so steps can verify counts without a table scan
+    context.row_counts = collections.Counter()
+    
     # Store created test data for cleanup
     context.test_user_ids = []
     context.temp_files = []
 
 def after_scenario(context, scenario):
     """Clean up after each scenario."""
-    # Restore original database file path constants
-    if hasattr(context, 'original_db_dir'):
-        context.db_module.DB_DIR = context.original_db_dir
-        context.db_module.DB_FILE = context.original_db_file
+    if hasattr(context, 'conn'):
+        context.conn.close()
+    if hasattr(context, 'verify_conn'):
+        context.verify_conn.close()
     
-    # Remove the temporary directory
-    if hasattr(context, 'test_dir'):
-        shutil.rmtree(context.test_dir)
+    # Remove any temporary files created by the scenario
+    for path in context.temp_files:
+        if os.path.exists(path):
+            os.unlink(path)
 
 # Register hooks with behave
 def before_all(context):
     context.config.setup_logging()
+    
+    # Create and initialize one shared in-memory database per implementation. The
+    # schema is built once here and snapshotted into a template for each scenario.
+    context.original_get_connections = {}
+    context.connection_factories = {}
+    context.shared_conns = {}
+    context.db_pools = {}
+    context.rw_pools = {}
+    context.templates = {}
+    context.users_schemas = {}
+    
+    for db_name, db_module in DB_MODULES.items():
+        uri = TEST_DB_URI.format(name=db_name)
+        
+        # Keep one connection open for the whole run so the database stays alive
+        context.shared_conns[db_name] = sqlite3.connect(uri, uri=True, check_same_thread=False)
+        context.shared_conns[db_name].set_trace_callback(None)
+        
+        context.original_get_connections[db_name] = db_module.get_connection
+        context.connection_factories[db_name] = make_connection_factory(uri)
+        db_module.get_connection = context.connection_factories[db_name]
+        
+        db_module.initialize_database()
+        for index_schema in LOOKUP_INDEXES:
+            context.shared_conns[db_name].execute(index_schema)
+        context.templates[db_name] = sqlite3.connect(":memory:", check_same_thread=False)
+        context.shared_conns[db_name].backup(context.templates[db_name])
+        # Every scenario starts from the template, so its users columns are read only once
+        context.users_schemas[db_name] = context.templates[db_name].execute("PRAGMA table_info(users)").fetchall()
+        context.db_pools[db_name] = ConnPool(context.connection_factories[db_name], POOL_SIZE)
+        context.rw_pools[db_name] = ReadWritePool(make_connection_factory(uri, PooledConnection), READER_POOL_SIZE)
 
 def after_all(context):
-    pass
+    """Restore the database modules and release the shared databases."""
+    for db_name, db_module in DB_MODULES.items():
+        db_module.get_connection = context.original_get_connections[db_name]
+        context.db_pools[db_name].close()
+        context.rw_pools[db_name].close()
+        context.templates[db_name].close()
+        context.shared_conns[db_name].close()
+    
+    SEED_EXECUTOR.shutdown(wait=True)
@@ -0,0 +1,100 @@
+from datetime import datetime, timedelta, timezone
+from behave import given, when, then
+
+from utils.user import UserSession
+
+@given('a login session for "{username}"')
+@when('a login session for "{username}" is created')
+def step_impl(context, username):
+    """Log a user in through a session manager."""
+    context.session_manager = UserSession()
+    context.session_id = context.session_manager.create_session(username, f"{username}@test.com")
+    assert context.session_id is not None, f"Could not create a session for {username}"
+
+@given('an expired login session for "{username}"')
+def step_impl(context, username):
+    """Store a session for a user that expired a day ago."""
+    user_id = context.db_module.get_or_create_user(username, f"{username}@test.com")
+    expired_at = (datetime.now(timezone.utc) - timedelta(days=1)).strftime(context.db_module.TIMESTAMP_FORMAT)
+    
+    context.session_id = "expired-session"
+    context.conn.execute("""
+        INSERT INTO user_sessions (session_id, user_id, username, email, expires_at)
+        VALUES (?, ?, ?, ?, ?)
+    """, (context.session_id, user_id, username, f"{username}@test.com", expired_at))
+    context.conn.commit()
+    context.expired_session_id = context.session_id
+
+@when('a new session manager loads the session')
+def step_impl(context):
+    """Load the stored session into a fresh session manager."""
+    context.loading_manager = UserSession()
+    context.session_loaded = context.loading_manager.load_session(context.session_id)
+
+@when('the session is destroyed')
+def step_impl(context):
+    """Log the user out."""
+    assert context.session_manager.destroy_session(context.session_id), "Session was not destroyed"
+    assert not context.session_manager.is_authenticated(), "Session manager is still logged in"
+
+@when('another login reuses the same session ID')
+def step_impl(context):
+    """Create a second session whose generated ID collides with the stored one."""
+    context.colliding_manager = UserSession()
+    context.colliding_manager.generate_session_id = lambda: context.session_id
+    context.colliding_session_id = context.colliding_manager.create_session("session_collision")
+
+@when('an admin deletes the user "{username}"')
+def step_impl(context, username):
+    """Delete a user through the admin API."""
+    context.deleted_user_id = context.db_module.get_user_id_by_username(username)
+    admin_id = context.db_module.get_user_id_by_username("admin")
+    success, message = context.db_module.delete_user(context.deleted_user_id, admin_id)
+    assert success, message
+
+@then('the session should load as "{username}"')
+def step_impl(context, username):
+    """Verify the loaded session belongs to the user."""
+    assert context.session_loaded, "Session could not be loaded"
+    user = context.loading_manager.get_current_user()
+    assert user['username'] == username, f"Loaded session belongs to {user['username']}"
+    assert user['id'] == context.session_manager.get_user_id(), "Loaded session has the wrong user ID"
+    assert context.loading_manager.session_id == context.session_id
+
+@then('the session should not load')
+def step_impl(context):
+    """Verify the session was rejected."""
+    assert not context.session_loaded, "Session loaded when it should have been rejected"
+    assert not context.loading_manager.is_authenticated(), "Session manager is logged in"
+
+@then('destroying the session again should report that it did not exist')
+def step_impl(context):
+    """Verify a second logout finds nothing to delete."""
+    assert not UserSession().destroy_session(context.session_id), "Session was destroyed twice"
+
+@then('the expired session should be removed from the database')
+def step_impl(context):
+    """Verify creating a session purged the expired one."""
+    row = context.verify_conn.execute(
+        "SELECT 1 FROM user_sessions WHERE session_id = ?", (context.expired_session_id,)
+    ).fetchone()
+    assert row is None, "Expired session is still stored"
+
+@then('no session ID should be returned')
+def step_impl(context):
+    """Verify the failed login did not hand out a session ID."""
+    assert context.colliding_session_id is None, "A session ID was returned for a session that was not stored"
+
+@then('the session manager should not be logged in')
+def step_impl(context):
+    """Verify the failed login left the session manager logged out."""
+    assert not context.colliding_manager.is_authenticated(), "Session manager is logged in"
+    assert context.colliding_manager.session_id is None
+
+@then('the user should have no stored sessions')
+def step_impl(context):
+    """Verify deleting the user removed their sessions."""
+    count = context.verify_conn.execute(
+        "SELECT COUNT(*) FROM user_sessions WHERE user_id = ?", (context.deleted_user_id,)
+    ).fetchone()[0]
+    assert count == 0, f"{count} sessions remain for the deleted user"
@@ -0,0 +1,51 @@
+import json
+import hashlib
+from datetime import datetime
+from pathlib import Path
+
+# Processed syllabus data and the PDF it is generated from
+DATA_DIR = Path(__file__).parent.parent / "data"
+PDF_PATH = DATA_DIR / "syllabus.pdf"
+MANIFEST_PATH = DATA_DIR / "manifest.json"
+DATA_FILES = ["chapters.json", "learning_objectives.json", "terms.json", "topics.json"]
+
+def file_sha256(path, chunk_size=1 << 20):
+    """Compute the SHA-256 hex digest of a file, reading it in chunks."""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def load_manifest():
+    """Load the data manifest, returning an empty dict if it is missing or invalid."""
+    try:
+        with open(MANIFEST_PATH, "r") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+def write_manifest(pdf_sha256):
+    """Record the hash of the PDF the data files were generated from."""
+    manifest = {
+        "pdf_sha256": pdf_sha256,
+        "generated_at": datetime.now().isoformat()
+    }
+    with open(MANIFEST_PATH, "w") as f:
+        json.dump(manifest, f, indent=2)
+
+def data_files_exist():
+    """Check whether every processed data file is present."""
+    return all((DATA_DIR / name).exists() for name in DATA_FILES)
+
+def data_matches_pdf(pdf_sha256):
+    """Check whether the data files were generated from the PDF with this hash.
+    
+    Data files without a manifest (as shipped with the repo) are taken to come from the
+    PDF next to them, and a manifest recording that is written.
+    """
+    manifest_sha256 = load_manifest().get("pdf_sha256")
+    if manifest_sha256 is None and data_files_exist():
+        write_manifest(pdf_sha256)
+        return True
+    return manifest_sha256 == pdf_sha256
@@ -1,23 +1,48 @@
 #!/usr/bin/env python
-import os
+"""Process the syllabus PDF into the data files. Run from the project root: python -m utils.init_data"""
 import sys
 import json
+import argparse
 
-# Add parent directory to path to allow importing from utils
-sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
-
+from utils.data_manifest import (
+    DATA_DIR, DATA_FILES, PDF_PATH, data_files_exist, data_matches_pdf, file_sha256, write_manifest
+)
 from utils.syllabus_processor import SyllabusProcessor
 
+def load_cached_result():
+    """Return the processed syllabus data if it was generated from the cached PDF, else None."""
+    if not PDF_PATH.exists() or PDF_PATH.stat().st_size == 0:
+        return None
+    if not data_files_exist() or not data_matches_pdf(file_sha256(PDF_PATH)):
+        return None
+    
+    result = {}
+    for name in DATA_FILES:
+        with open(DATA_DIR / name, "r") as f:
+            result[name[:-len(".json")]] = json.load(f)
+    return result
+
 def main():
+    parser = argparse.ArgumentParser(description='Initialize the ISTQB AI Certification syllabus data.')
+    parser.add_argument('--force', action='store_true',
+                        help='Reprocess the syllabus even if the data files are up to date')
+    args = parser.parse_args()
+    
     # URL to the ISTQB AI Testing Syllabus PDF
     syllabus_url = "https://www.istqb.org/wp-content/uploads/2024/11/ISTQB_CT-AI_Syllabus_v1.0_mghocmT.pdf"
     
     print("Initializing ISTQB AI Certification syllabus data...")
-    processor = SyllabusProcessor(pdf_url=syllabus_url)
     
     try:
-        result = processor.process_syllabus()
-        print(f"Successfully processed syllabus with:")
+        # Reuse the data files when they were generated from the PDF already on disk
+        result = None if args.force else load_cached_result()
+        if result is not None:
+            print("Data files are up to date with the cached PDF, skipping processing.")
+        else:
+            processor = SyllabusProcessor(pdf_url=syllabus_url)
+            result = processor.process_syllabus()
+            write_manifest(file_sha256(processor.pdf_path))
+            print(f"Successfully processed syllabus with:")
         print(f" - {len(result['chapters'])} chapters")
         print(f" - {sum(len(los) for los in result['learning_objectives'].values())} learning objectives")
         print(f" - {len(result['terms'])} key terms")
@@ -4,29 +4,156 @@ import pdfplumber
 import re
 import nltk
 import json
-import pandas as pd
-from nltk.tokenize import sent_tokenize, word_tokenize
+import mmap
+import sys
+import types
+from bisect import bisect_right
+from collections import namedtuple
+from contextlib import contextmanager
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
+from itertools import repeat
+from nltk.tokenize import NLTKWordTokenizer
 from nltk.corpus import stopwords
 
-# Download NLTK resources
-nltk.download('punkt')
-nltk.download('stopwords')
+# Chapters used when the syllabus text cannot be split into chapters
+_PLACEHOLDER_CHAPTERS = types.MappingProxyType({
+    "1. Introduction to AI Testing": "This chapter introduces the concepts of AI testing.",
+    "2. AI Quality Characteristics": "This chapter covers quality attributes specific to AI systems.",
+    "3. Testing AI-Based Systems": "This chapter describes methods for testing AI systems.",
+    "4. AI Testing Methods": "This chapter details specific test methods for AI applications.",
+    "5. AI Testing in the SDLC": "This chapter explains how AI testing fits into the software development lifecycle."
+})
 
-# Make sure NLTK data is available
+# orjson encodes the processed data several times faster; fall back to json without it
 try:
-    sent_tokenize("This is a test sentence. This is another test sentence.")
-    print("NLTK tokenizers loaded successfully.")
-except Exception as e:
-    print(f"Error with NLTK: {str(e)}")
-    # Fallback to more basic tokenization if NLTK fails
-    def simple_sent_tokenize(text):
-        return text.replace('\n', ' ').split('.')
-    def simple_word_tokenize(text):
-        return text.split()
-    # Replace the NLTK functions with our simple versions
-    globals()['sent_tokenize'] = simple_sent_tokenize
-    globals()['word_tokenize'] = simple_word_tokenize
-    print("Using simple tokenization as fallback.")
+    import orjson
+except ImportError:
+    orjson = None
+
+# Patterns used while parsing the syllabus, compiled once at import
+# Chapter titles (e.g., "1. Introduction to AI Testing" or "1 Introduction to AI Testing")
+_CHAPTER_RE = re.compile(r'(\d+\.?\s+[A-Z][a-zA-Z\s]+)')
+# Learning objectives (e.g., "LO-1.2.3 Explain ...")
+_LO_RE = re.compile(r'LO-\d+\.\d+\.\d+\s+(.+?)(?=LO-|\Z)', re.DOTALL)
+# Key terms and their definitions (e.g., "Test Oracle: A source to determine ...")
+_TERM_RE = re.compile(r'([A-Z][a-zA-Z\s]+):\s+([^.]+\.)')
+# Potential key phrases (e.g., "Machine Learning", "Test Case")
+_KEY_PHRASE_RE = re.compile(r'\b[A-Z][a-zA-Z]*(?:\s+[A-Za-z]+){0,3}\b')
+
+# A candidate topic row; only the rows that survive deduplication become dicts
+_Topic = namedtuple('_Topic', 'topic chapter context')
+
+def _write_json(path, data):
+    """Write data to path as JSON indented by two spaces, using orjson when available."""
+    if orjson is not None:
+        with open(path, 'wb') as f:
+            f.write(orjson.dumps(data, option=orjson.OPT_INDENT_2))
+    else:
+        with open(path, 'w') as f:
+            json.dump(data, f, indent=2)
+
+@contextmanager
+def _open_pdf(pdf_path, pages=None):
+    """Open a PDF with pdfplumber over a read-only memory map of the file.
+    
+    pdfminer seeks all over the file to follow cross-references; reading from the map
+    serves those jumps from the page cache instead of a seek and read syscall each.
+    """
+    with open(pdf_path, 'rb') as fh, mmap.mmap(fh.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        with pdfplumber.open(mm, pages=pages) as pdf:
+            yield pdf
+
+def _extract_page_range(pdf_path, start, stop):
+    """Extract the text of pages [start, stop) of a PDF, one line-terminated block per page."""
+    parts = []
+    with _open_pdf(pdf_path, pages=list(range(start + 1, stop + 1))) as pdf:
+        for page in pdf.pages:
+            # Image-only pages extract as None, so they contribute an empty line
+            parts.append(page.extract_text() or "")
+            parts.append("\n")
+            # Drop the page's parsed layout and character caches before moving on
+            page.close()
+    return "".join(parts)
+
+def _nltk_resource(load, package):
+    """Call load(), downloading the NLTK data package and retrying once if it is missing."""
+    try:
+        return load()
+    except LookupError:
+        nltk.download(package, quiet=True)
+        return load()
+
+@lru_cache(maxsize=None)
+def english_stopwords():
+    """Load the NLTK English stopword list once, as a frozenset."""
+    return frozenset(_nltk_resource(lambda: stopwords.words('english'), 'stopwords'))
+
+def _keep_lines(text):
+    """NLTK text preparation: Punkt handles line breaks itself, so the text is used as is."""
+    return text
+
+def _join_lines(text):
+    """Fallback text preparation: fold line breaks into spaces before splitting on full stops."""
+    return text.replace('\n', ' ')
+
+def _simple_sent_spans(text):
+    """Fallback sentence splitter: (start, end) offsets of the pieces between full stops."""
+    start = 0
+    for match in re.finditer(r'\.', text):
+        yield start, match.start()
+        start = match.end()
+    yield start, len(text)
+
+def _simple_word_tokenize(text):
+    """Fallback word tokenizer: split on whitespace."""
+    return text.split()
+
+# The NLTK tokenizers, once they have been built successfully
+_nltk_tokenizers = None
+
+def _tokenizers():
+    """Return (prepare_text, sent_spans, word_tokenize) for topic indexing.
+    
+    The NLTK tokenizers are built on first use and kept once they load. If NLTK fails, the
+    simple tokenizers are returned for this call only, so a later call tries NLTK again.
+    """
+    global _nltk_tokenizers
+    if _nltk_tokenizers is not None:
+        return _nltk_tokenizers
+    try:
+        try:
+            from nltk.tokenize import PunktTokenizer
+            punkt = _nltk_resource(lambda: PunktTokenizer('english'), 'punkt_tab')
+        except ImportError:
+            # NLTK releases before 3.8.2 ship Punkt as a pickled model
+            punkt = _nltk_resource(lambda: nltk.data.load('tokenizers/punkt/english.pickle'), 'punkt')
+        # The word tokenizer behind word_tokenize, applied to text that is already one sentence
+        word_tokenize = NLTKWordTokenizer().tokenize
+        list(punkt.span_tokenize("This is a test sentence. This is another test sentence."))
+        print("NLTK tokenizers loaded successfully.")
+        _nltk_tokenizers = (_keep_lines, punkt.span_tokenize, word_tokenize)
+        return _nltk_tokenizers
+    except Exception as e:
+        print(f"Error with NLTK: {str(e)}")
+        print("Using simple tokenization as fallback.")
+        return _join_lines, _simple_sent_spans, _simple_word_tokenize
+
+@lru_cache(maxsize=64)
+def _extract_los_from(content):
+    """Return the learning objectives found in a chapter's text, cached per text."""
+    # Skip the regex scan for chapters without a single LO marker
+    if 'LO-' not in content:
+        return ()
+    return tuple(lo.group(1).strip() for lo in _LO_RE.finditer(content))
+
+@lru_cache(maxsize=64)
+def _extract_terms_from(content):
+    """Return the (term, definition) pairs found in a chapter's text, cached per text."""
+    # Every term is followed by a colon, so chapters without one have none
+    if ':' not in content:
+        return ()
+    return tuple((match.group(1).strip(), match.group(2).strip()) for match in _TERM_RE.finditer(content))
 
 class SyllabusProcessor:
     def __init__(self, pdf_url=None, pdf_path=None):
@@ -61,11 +188,15 @@ class SyllabusProcessor:
         
         # If not cached, download the PDF
         try:
-            response = requests.get(self.pdf_url)
-            response.raise_for_status()
-            
-            with open(pdf_path, 'wb') as f:
-                f.write(response.content)
+            # Stream to a temporary file so a failed download never looks like a cached PDF
+            part_path = pdf_path + '.part'
+            with requests.get(self.pdf_url, stream=True, timeout=30) as response:
+                response.raise_for_status()
+                
+                with open(part_path, 'wb') as f:
+                    for chunk in response.iter_content(chunk_size=65536):
+                        f.write(chunk)
+            os.replace(part_path, pdf_path)
             
             self.pdf_path = pdf_path
             print(f"PDF downloaded successfully to {pdf_path}")
@@ -80,12 +211,26 @@ class SyllabusProcessor:
         if not self.pdf_path or not os.path.exists(self.pdf_path):
             raise FileNotFoundError("PDF file not found")
         
-        text = ""
-        with pdfplumber.open(self.pdf_path) as pdf:
-            for page in pdf.pages:
-                text += page.extract_text() + "\n"
+        with _open_pdf(self.pdf_path) as pdf:
+            page_count = len(pdf.pages)
+        
+        # Layout analysis is CPU-bound and pages are independent, so each worker
+        # process opens the PDF once and extracts one contiguous range of pages
+        workers = min(os.cpu_count() or 1, page_count)
+        if workers <= 1:
+            return _extract_page_range(self.pdf_path, 0, page_count)
         
-        return text
+        step = -(-page_count // workers)
+        starts = range(0, page_count, step)
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            ranges = executor.map(_extract_page_range, repeat(self.pdf_path), starts,
+                                  [min(start + step, page_count) for start in starts])
+            return "".join(ranges)
+    
+    def _use_placeholder_chapters(self):
+        """Replace the chapters with a copy of the placeholder chapters."""
+        self.chapters = dict(_PLACEHOLDER_CHAPTERS)
+        return self.chapters
     
     def parse_chapters(self, text):
         """
@@ -94,22 +239,12 @@ class SyllabusProcessor:
         # If we couldn't extract proper chapters, create a simplified structure
         if not text or len(text) < 100:
             print("Warning: Extracted text is too short. Generating placeholder content.")
-            self.chapters = {
-                "1. Introduction to AI Testing": "This chapter introduces the concepts of AI testing.",
-                "2. AI Quality Characteristics": "This chapter covers quality attributes specific to AI systems.",
-                "3. Testing AI-Based Systems": "This chapter describes methods for testing AI systems.",
-                "4. AI Testing Methods": "This chapter details specific test methods for AI applications.",
-                "5. AI Testing in the SDLC": "This chapter explains how AI testing fits into the software development lifecycle."
-            }
-            return self.chapters
+            return self._use_placeholder_chapters()
         
         # Try to parse the chapters
         try:
-            # Pattern to identify chapter titles (e.g., "1. Introduction to AI Testing" or "1 Introduction to AI Testing")
-            chapter_pattern = r'(\d+\.?\s+[A-Z][a-zA-Z\s]+)'
-            
             # Split by chapters
-            chapter_matches = re.finditer(chapter_pattern, text)
+            chapter_matches = _CHAPTER_RE.finditer(text)
             chapter_positions = [(m.group(0), m.start()) for m in chapter_matches]
             
             # If we couldn't find chapters, create some basic ones from the text
@@ -135,13 +270,7 @@ class SyllabusProcessor:
                 self.chapters[chapter_title] = chapter_content
         except Exception as e:
             print(f"Error parsing chapters: {str(e)}. Creating placeholder content.")
-            self.chapters = {
-                "1. Introduction to AI Testing": "This chapter introduces the concepts of AI testing.",
-                "2. AI Quality Characteristics": "This chapter covers quality attributes specific to AI systems.",
-                "3. Testing AI-Based Systems": "This chapter describes methods for testing AI systems.",
-                "4. AI Testing Methods": "This chapter details specific test methods for AI applications.",
-                "5. AI Testing in the SDLC": "This chapter explains how AI testing fits into the software development lifecycle."
-            }
+            self._use_placeholder_chapters()
             
         return self.chapters
     
@@ -150,15 +279,7 @@ class SyllabusProcessor:
         Extract learning objectives from each chapter.
         """
         for chapter, content in self.chapters.items():
-            # Pattern to identify learning objectives
-            lo_pattern = r'LO-\d+\.\d+\.\d+\s+(.+?)(?=LO-|\Z)'
-            learning_objectives = re.finditer(lo_pattern, content, re.DOTALL)
-            
-            chapter_los = []
-            for lo in learning_objectives:
-                chapter_los.append(lo.group(1).strip())
-            
-            self.learning_objectives[chapter] = chapter_los
+            self.learning_objectives[chapter] = list(_extract_los_from(content))
         
         return self.learning_objectives
     
@@ -167,15 +288,8 @@ class SyllabusProcessor:
         Extract key terms and their definitions from the syllabus.
         """
         # This is a simplified approach; actual implementation may need more sophisticated parsing
-        term_pattern = r'([A-Z][a-zA-Z\s]+):\s+([^.]+\.)'
-        
         for chapter, content in self.chapters.items():
-            term_matches = re.finditer(term_pattern, content)
-            
-            for match in term_matches:
-                term = match.group(1).strip()
-                definition = match.group(2).strip()
-                self.terms[term] = definition
+            self.terms.update(_extract_terms_from(content))
         
         return self.terms
     
@@ -183,47 +297,49 @@ class SyllabusProcessor:
         """
         Create an index of topics from the syllabus.
         """
-        stop_words = set(stopwords.words('english'))
-        
-        # Regular expression to identify potential key phrases (e.g., "Machine Learning", "Test Case")
-        key_phrase_pattern = r'\b[A-Z][a-zA-Z]*(?:\s+[A-Za-z]+){0,3}\b'
+        stop_words = english_stopwords()
+        prepare_text, sent_spans, word_tokenize = _tokenizers()
+        candidates = []
+        add = candidates.append
         
         for chapter, content in self.chapters.items():
-            sentences = sent_tokenize(content)
+            content = prepare_text(content)
+            spans = list(sent_spans(content))
+            starts = [start for start, _ in spans]
+            # Every topic from a sentence shares one context string
+            sentences = [sys.intern(content[start:end]) for start, end in spans]
             
-            for sentence in sentences:
-                # Extract potential key phrases (capitalized words or phrases)
-                key_phrases = re.findall(key_phrase_pattern, sentence)
-                
+            # Extract potential key phrases (capitalized words or phrases) in one pass over
+            # the chapter, filing each under the sentence it starts in
+            key_phrases = [[] for _ in sentences]
+            for match in _KEY_PHRASE_RE.finditer(content):
+                key_phrases[bisect_right(starts, match.start()) - 1].append(match.group(0))
+            
+            for sentence, sentence_phrases in zip(sentences, key_phrases):
                 # Add key phrases as topics
-                for phrase in key_phrases:
-                    if len(phrase) > 3 and not all(word.lower() in stop_words for word in phrase.split()):
-                        self.topics.append({
-                            'topic': phrase,
-                            'chapter': chapter,
-                            'context': sentence
-                        })
+                for phrase in sentence_phrases:
+                    if len(phrase) > 3 and not all(part in stop_words for part in phrase.lower().split()):
+                        add(_Topic(phrase, chapter, sentence))
                 
                 # Also extract individual important words as before
-                words = [word.lower() for word in word_tokenize(sentence) if word.isalnum() and word.lower() not in stop_words]
+                words = [word for word in (token.lower() for token in word_tokenize(sentence) if token.isalnum())
+                         if word not in stop_words]
                 
                 for word in words:
                     if len(word) > 4:  # Increased minimum length to 5 characters for individual words
-                        self.topics.append({
-                            'topic': word,
-                            'chapter': chapter,
-                            'context': sentence
-                        })
+                        add(_Topic(word, chapter, sentence))
         
-        # Convert to DataFrame for easier filtering and searching
-        topics_df = pd.DataFrame(self.topics)
         # Remove duplicates - consider context as well to avoid duplicate contexts
-        topics_df = topics_df.drop_duplicates(subset=['context'])
-        # Also remove duplicate topics within the same chapter if they have different contexts
-        topics_df = topics_df.sort_values('context', key=lambda x: x.str.len(), ascending=False)
-        topics_df = topics_df.drop_duplicates(subset=['topic', 'chapter'])
+        by_context = {}
+        for topic in candidates:
+            by_context.setdefault(topic.context, topic)
+        # Also remove duplicate topics within the same chapter if they have different contexts,
+        # keeping the one with the longest context
+        by_topic = {}
+        for topic in sorted(by_context.values(), key=lambda t: len(t.context), reverse=True):
+            by_topic.setdefault((topic.topic, topic.chapter), topic)
         
-        self.topics = topics_df.to_dict('records')
+        self.topics = [topic._asdict() for topic in by_topic.values()]
         return self.topics
     
     def save_processed_data(self):
@@ -232,17 +348,10 @@ class SyllabusProcessor:
         """
         os.makedirs(self.data_dir, exist_ok=True)
         
-        with open(os.path.join(self.data_dir, 'chapters.json'), 'w') as f:
-            json.dump(self.chapters, f, indent=2)
-        
-        with open(os.path.join(self.data_dir, 'learning_objectives.json'), 'w') as f:
-            json.dump(self.learning_objectives, f, indent=2)
-        
-        with open(os.path.join(self.data_dir, 'terms.json'), 'w') as f:
-            json.dump(self.terms, f, indent=2)
-        
-        with open(os.path.join(self.data_dir, 'topics.json'), 'w') as f:
-            json.dump(self.topics, f, indent=2)
+        _write_json(os.path.join(self.data_dir, 'chapters.json'), self.chapters)
+        _write_json(os.path.join(self.data_dir, 'learning_objectives.json'), self.learning_objectives)
+        _write_json(os.path.join(self.data_dir, 'terms.json'), self.terms)
+        _write_json(os.path.join(self.data_dir, 'topics.json'), self.topics)
         
         print("All data saved to JSON files in the data directory")
     
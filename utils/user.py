@@ -1,16 +1,37 @@
-import json
+from datetime import datetime, timedelta, timezone
+import base64
 import os
-from pathlib import Path
-from datetime import datetime, timedelta
-import secrets
+import threading
 import hashlib
-from db.database_refactored import get_or_create_user
+from db.database_refactored import (
+    TIMESTAMP_FORMAT, create_user_session, get_user_session, delete_user_session,
+    get_user_id_by_username, update_user_metadata, is_admin as _db_is_admin
+)
 
-# Define session directory
-SESSION_DIR = Path(__file__).parent.parent / "data" / "sessions"
+# How long a login session stays valid
+SESSION_LIFETIME = timedelta(days=7)
 
-# Ensure session directory exists
-os.makedirs(SESSION_DIR, exist_ok=True)
+# Session IDs are 32 random bytes, cut from a per-thread buffer refilled with one urandom call
+SESSION_ID_BYTES = 32
+_RANDOM_BUFFER_SIZE = 1024
+_random = threading.local()
+
+def _reset_random_buffers():
+    """Drop every buffered random byte, so a forked child never reuses its parent's."""
+    global _random
+    _random = threading.local()
+
+os.register_at_fork(after_in_child=_reset_random_buffers)
+
+def _random_bytes(n):
+    """Return n bytes from the current thread's urandom buffer, refilling it when exhausted."""
+    buf = getattr(_random, 'buf', b'')
+    pos = getattr(_random, 'pos', 0)
+    if pos + n > len(buf):
+        buf, pos = os.urandom(max(n, _RANDOM_BUFFER_SIZE)), 0
+        _random.buf = buf
+    _random.pos = pos + n
+    return buf[pos:pos + n]
 
 class UserSession:
     def __init__(self):
@@ -21,86 +42,69 @@ class UserSession:
         
     def generate_session_id(self):
         """Generate a random session ID."""
-        return secrets.token_urlsafe(32)
+        return base64.urlsafe_b64encode(_random_bytes(SESSION_ID_BYTES)).rstrip(b'=').decode('ascii')
     
     def create_session(self, username, email=None):
-        """Create a new user session."""
-        # Get or create the user in the database
-        user_id = get_or_create_user(username, email)
+        """Create a new user session, returning its ID, or None if it could not be stored."""
+        session_id = self.generate_session_id()
+        
+        # Session timestamps are UTC, so they compare with CURRENT_TIMESTAMP
+        now = datetime.now(timezone.utc)
+        created_at = now.strftime(TIMESTAMP_FORMAT)
+        expires_at = (now + SESSION_LIFETIME).strftime(TIMESTAMP_FORMAT)
+        
+        # Get or create the user and store the session in one database transaction
+        user_id = create_user_session(session_id, username, email, expires_at)
+        if user_id is None:
+            return None
         
         # Create session data
-        self.session_id = self.generate_session_id()
+        self.session_id = session_id
         self.current_user = {
             'id': user_id,
             'username': username,
             'email': email
         }
-        
-        # Save session data
         self.session_data = {
             'user_id': user_id,
             'username': username,
             'email': email,
-            'created_at': datetime.now().isoformat(),
-            'expires_at': (datetime.now() + timedelta(days=7)).isoformat()
+            'created_at': created_at,
+            'expires_at': expires_at
         }
         
-        # Write session to file
-        session_path = SESSION_DIR / f"{self.session_id}.json"
-        with open(session_path, 'w') as f:
-            json.dump(self.session_data, f)
-        
         return self.session_id
     
     def load_session(self, session_id):
         """Load an existing user session."""
-        session_path = SESSION_DIR / f"{session_id}.json"
-        
-        if not session_path.exists():
+        # Expired sessions are never returned
+        session_data = get_user_session(session_id)
+        if session_data is None:
             return False
         
-        try:
-            with open(session_path, 'r') as f:
-                self.session_data = json.load(f)
-            
-            # Check if session is expired
-            expires_at = datetime.fromisoformat(self.session_data['expires_at'])
-            if datetime.now() > expires_at:
-                self.destroy_session(session_id)
-                return False
-            
-            # Set current user
-            self.current_user = {
-                'id': self.session_data['user_id'],
-                'username': self.session_data['username'],
-                'email': self.session_data.get('email')
-            }
-            self.session_id = session_id
-            
-            return True
-        except Exception as e:
-            print(f"Error loading session: {str(e)}")
-            return False
+        self.session_data = session_data
+        
+        # Set current user
+        self.current_user = {
+            'id': session_data['user_id'],
+            'username': session_data['username'],
+            'email': session_data['email']
+        }
+        self.session_id = session_id
+        
+        return True
     
     def destroy_session(self, session_id):
         """Destroy a user session."""
-        session_path = SESSION_DIR / f"{session_id}.json"
+        if not delete_user_session(session_id):
+            return False
         
-        if session_path.exists():
-            try:
-                os.remove(session_path)
-                
-                if self.session_id == session_id:
-                    self.session_id = None
-                    self.current_user = None
-                    self.session_data = {}
-                
-                return True
-            except Exception as e:
-                print(f"Error destroying session: {str(e)}")
-                return False
+        if self.session_id == session_id:
+            self.session_id = None
+            self.current_user = None
+            self.session_data = {}
         
-        return False
+        return True
     
     def get_current_user(self):
         """Get the current authenticated user."""
@@ -121,16 +125,15 @@ class UserSession:
         if not self.is_authenticated():
             return False
         
-        from db.database_refactored import is_admin
-        return is_admin(self.current_user['username'])
+        return _db_is_admin(self.current_user['username'])
     
     def make_admin(self, username):
         """Grant admin privileges to a user."""
         if not self.is_admin():
             return False, "You need admin privileges to perform this action"
         
-        from db.database_refactored import set_admin_status
-        success = set_admin_status(username, True)
+        user_id = get_user_id_by_username(username)
+        success = user_id is not None and update_user_metadata(user_id, is_admin=True)[0]
         
         if success:
             return True, f"Admin privileges granted to {username}"
@@ -146,8 +149,8 @@ class UserSession:
         if self.current_user['username'] == username:
             return False, "Cannot revoke your own admin privileges"
         
-        from db.database_refactored import set_admin_status
-        success = set_admin_status(username, False)
+        user_id = get_user_id_by_username(username)
+        success = user_id is not None and update_user_metadata(user_id, is_admin=False)[0]
         
         if success:
             return True, f"Admin privileges revoked from {username}"